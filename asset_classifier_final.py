@@ -14,6 +14,11 @@ from googlesearch import search
 import re
 from urllib.parse import urlparse
 
+from resilience import get_endpoint
+
+# Endpoint di ricerca con retry, circuit breaker e concorrenza adattiva
+SEARCH_ENDPOINT = "google"
+
 # Configurazione logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -35,6 +40,8 @@ class ClassificationResult:
     ticker: Optional[str] = None
     weight: Optional[float] = None
     error_message: Optional[str] = None
+    # True se la ricerca è fallita per un errore temporaneo (rete, throttling, circuito, budget)
+    transient: bool = False
 
 
 def primo_risultato_investing(result: ClassificationResult) -> ClassificationResult:
@@ -53,7 +60,8 @@ def primo_risultato_investing(result: ClassificationResult) -> ClassificationRes
     
     try:
         from googlesearch import search
-        search_results = search(full_query, advanced=True)
+        # La ricerca è lazy: va consumata dentro la chiamata protetta
+        search_results = get_endpoint(SEARCH_ENDPOINT).call(lambda: list(search(full_query, advanced=True)))
         
         for search_result in search_results:
             url = search_result.url
@@ -81,6 +89,7 @@ def primo_risultato_investing(result: ClassificationResult) -> ClassificationRes
             
     except Exception as e:
         result.error_message = f"Errore durante la ricerca: {e}"
+        result.transient = True
         print(f"[Errore] durante la ricerca: {e}", file=sys.stderr)
     
     return result
@@ -127,8 +136,9 @@ class AssetClassifier:
         r'^[A-Z0-9]{1,6}\.[A-Z]{1,3}$',  # Con exchange (.L, .PA, .MI, etc.)
     ]
     
-    def __init__(self):
-        pass
+    def __init__(self, lookup_store=None):
+        # LookupStore opzionale: cache e budget di ricerche condivisi tra processi
+        self.lookup_store = lookup_store
     
     def is_isin(self, text: str) -> bool:
         """Verifica se è un ISIN valido"""
@@ -191,9 +201,7 @@ class AssetClassifier:
             ticker=ticker.upper()
         )
         
-        # Cerca l'ISIN
-        updated_result = primo_risultato_investing(temp_result)
-        return updated_result.isin
+        return self._lookup_isin(temp_result).isin
 
     def get_isin_from_name(self, name: str) -> Optional[str]:
         """
@@ -205,9 +213,28 @@ class AssetClassifier:
             asset_type=AssetType.NAME
         )
         
-        # Cerca l'ISIN
-        updated_result = primo_risultato_investing(temp_result)
-        return updated_result.isin
+        return self._lookup_isin(temp_result).isin
+
+    def _lookup_isin(self, temp_result: ClassificationResult) -> ClassificationResult:
+        """
+        Cerca l'ISIN, passando dalla cache condivisa se configurata.
+        In caso di errore temporaneo (es. circuito aperto, budget esaurito) il messaggio resta in temp_result.
+        """
+        def lookup():
+            updated_result = primo_risultato_investing(temp_result)
+            # Gli errori temporanei non vanno salvati in cache
+            return updated_result.isin, not updated_result.transient
+
+        if self.lookup_store is None:
+            lookup()
+        else:
+            query = f"{temp_result.asset_type.value}:{temp_result.original_value.strip()}"
+            temp_result.isin = self.lookup_store.resolve(query, lookup)
+        return temp_result
+
+    def _lookup_error(self, temp_result: ClassificationResult) -> Optional[str]:
+        """Messaggio da riportare nel risultato: solo i fallimenti della ricerca, non l'ISIN mancante"""
+        return temp_result.error_message if temp_result.transient else None
     
     def classify_asset(self, asset_value: str) -> ClassificationResult:
         """Classifica un singolo asset (ottimizzato)"""
@@ -230,27 +257,33 @@ class AssetClassifier:
                 )
             
             if self.is_ticker(cleaned):
-                isin = self.get_isin_from_ticker(cleaned)
+                lookup = self._lookup_isin(ClassificationResult(cleaned, AssetType.TICKER, ticker=cleaned.upper()))
                 return ClassificationResult(
                     original_value=asset_value,
                     asset_type=AssetType.TICKER,
                     ticker=cleaned.upper(),
-                    isin=isin
+                    isin=lookup.isin,
+                    error_message=self._lookup_error(lookup),
+                    transient=lookup.transient
                 )
             
             if self.is_name(cleaned):
-                isin = self.get_isin_from_name(cleaned)
+                lookup = self._lookup_isin(ClassificationResult(cleaned, AssetType.NAME))
                 return ClassificationResult(
                     original_value=asset_value,
                     asset_type=AssetType.NAME,
-                    isin=isin
+                    isin=lookup.isin,
+                    error_message=self._lookup_error(lookup),
+                    transient=lookup.transient
                 )
             
+            lookup = self._lookup_isin(ClassificationResult(cleaned, AssetType.NAME))
             return ClassificationResult(
                 original_value=asset_value,
                 asset_type=AssetType.UNKNOWN,
-                isin= self.get_isin_from_name(cleaned),
-                error_message="Tipo di asset non riconosciuto"
+                isin=lookup.isin,
+                error_message=self._lookup_error(lookup) or "Tipo di asset non riconosciuto",
+                transient=lookup.transient
             )
             
         except Exception as e:
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Batch Asset Classifier - Classificazione di molti file JSON di output OCR in parallelo
+Utilizzo: python batch.py input1.json input2.json ... --output-dir results/
+          python batch.py ocr_outputs/ --ndjson results.ndjson --workers 8
+"""
+
+import json
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import resilience
+from asset_classifier_final import SEARCH_ENDPOINT, AssetClassifier
+from lookup_store import LookupStore, SharedCircuitBreaker, SharedRateLimiter
+from test import Classificationator
+
+# Stato per processo, inizializzato da _init_worker
+_classifier: Optional[AssetClassifier] = None
+
+
+def collect_input_files(inputs: List[str]) -> List[Path]:
+    """Espande directory in file .json, mantenendo l'ordine e rimuovendo i duplicati"""
+    files = []
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            files.extend(sorted(path.glob("*.json")))
+        else:
+            files.append(path)
+    return list(dict.fromkeys(path.resolve() for path in files))
+
+
+def output_paths(input_files: List[Path], output_dir: str) -> Dict[str, Path]:
+    """
+    Mappa ogni input su <output_dir>/<percorso relativo alla radice comune>.results.json,
+    così file con lo stesso nome in directory diverse non si sovrascrivono
+    """
+    root = Path(os.path.commonpath([path.parent for path in input_files]))
+    return {
+        str(path): Path(output_dir) / path.relative_to(root).with_suffix(".results.json")
+        for path in input_files
+    }
+
+
+def _init_worker(db_path: str, min_interval: float, negative_ttl: float) -> None:
+    """
+    Apre una connessione al LookupStore condiviso per ogni processo del pool e vi collega
+    circuit breaker e limiter della ricerca, così retry e throttling valgono per tutti i worker
+    """
+    global _classifier
+    store = LookupStore(db_path, min_interval=min_interval, negative_ttl=negative_ttl)
+    resilience.configure_endpoint(
+        SEARCH_ENDPOINT,
+        breaker=SharedCircuitBreaker(store, SEARCH_ENDPOINT),
+        limiter=SharedRateLimiter(store),
+    )
+    _classifier = AssetClassifier(lookup_store=store)
+
+
+def classify_file(input_file: str) -> Tuple[str, Optional[list], Optional[str], int, int, int, Dict]:
+    """Classifica un singolo file; ritorna (file, risultati, errore, cache hit, ricerche, pid, stato resilience)"""
+    store = _classifier.lookup_store
+    hits_before, lookups_before = store.cache_hits, store.lookups
+    try:
+        with open(input_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        # Classificationator restituisce [] anche in caso di errore: lo schema va validato qui
+        if not isinstance(data, dict) or not isinstance(data.get("assets"), list):
+            raise ValueError("chiave 'assets' mancante o non è una lista")
+        results = Classificationator(data, classifier=_classifier)
+        if data["assets"] and not results:
+            raise ValueError("nessun asset classificato")
+        error = None
+    except Exception as e:
+        results, error = None, str(e)
+    return (
+        input_file, results, error, store.cache_hits - hits_before, store.lookups - lookups_before,
+        os.getpid(), resilience.snapshot(),
+    )
+
+
+def summarize_resilience(worker_states: Dict[int, Dict], shared_state: Dict[str, Dict]) -> Dict[str, Dict]:
+    """Somma i contatori per endpoint su tutti i worker e aggiunge lo stato condiviso (circuito, intervallo)"""
+    summary: Dict[str, Dict] = {}
+    for endpoints in worker_states.values():
+        for name, state in endpoints.items():
+            totals = summary.setdefault(name, {"workers": 0})
+            totals["workers"] += 1
+            for counter in ("calls", "retries", "throttled", "failures", "short_circuited"):
+                totals[counter] = totals.get(counter, 0) + state[counter]
+    for name, state in shared_state.items():
+        summary.setdefault(name, {}).update(state)
+    return summary
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="The JSON files (or directories of JSON files) to classify.",
+    )
+    output_group = parser.add_mutually_exclusive_group(required=True)
+    output_group.add_argument(
+        "--output-dir",
+        type=str,
+        help="The directory where one <name>.results.json is written per input file, mirroring the input tree.",
+    )
+    output_group.add_argument(
+        "--ndjson",
+        type=str,
+        help="The NDJSON file where one {\"file\", \"results\"} line is written per input file.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="The number of worker processes.",
+    )
+    parser.add_argument(
+        "--db",
+        type=str,
+        default="lookup_cache.sqlite",
+        help="The SQLite file holding the lookup cache and request budget shared by workers.",
+    )
+    parser.add_argument(
+        "--max-requests",
+        type=int,
+        default=None,
+        help="The maximum number of search requests for the whole run, across all workers.",
+    )
+    parser.add_argument(
+        "--min-interval",
+        type=float,
+        default=2.0,
+        help="The minimum number of seconds between two search requests, across all workers.",
+    )
+    parser.add_argument(
+        "--negative-ttl-days",
+        type=float,
+        default=7.0,
+        help="The number of days after which a cached 'ISIN not found' result is searched again.",
+    )
+    args = parser.parse_args()
+
+    input_files = collect_input_files(args.inputs)
+    if not input_files:
+        print("Nessun file JSON trovato")
+        sys.exit(1)
+
+    # Il budget è globale per il run, la cache degli ISIN resta valida tra un run e l'altro
+    store = LookupStore(args.db, min_interval=args.min_interval)
+    store.reset_budget(args.max_requests)
+    # Una connessione SQLite aperta non va ereditata dai worker creati con fork: corrompe il database
+    store.close()
+
+    if args.output_dir:
+        destinations = output_paths(input_files, args.output_dir)
+        ndjson_file = None
+    else:
+        ndjson_file = open(args.ndjson, 'w', encoding='utf-8')
+
+    start = time.perf_counter()
+    failed, cache_hits, lookups = 0, 0, 0
+    # Ultimo stato resilience noto per ogni processo worker
+    worker_states: Dict[int, Dict] = {}
+    try:
+        with ProcessPoolExecutor(
+            max_workers=args.workers,
+            initializer=_init_worker,
+            initargs=(args.db, args.min_interval, args.negative_ttl_days * 24 * 3600),
+        ) as executor:
+            futures = [executor.submit(classify_file, str(path)) for path in input_files]
+            for future in as_completed(futures):
+                input_file, results, error, hits, file_lookups, pid, state = future.result()
+                worker_states[pid] = state
+                cache_hits += hits
+                lookups += file_lookups
+                if error is not None:
+                    failed += 1
+                    print(f"Errore in {input_file}: {error}")
+                    continue
+
+                if ndjson_file is not None:
+                    ndjson_file.write(json.dumps({"file": input_file, "results": results}, ensure_ascii=False) + "\n")
+                else:
+                    output_file = destinations[input_file]
+                    output_file.parent.mkdir(parents=True, exist_ok=True)
+                    with open(output_file, 'w', encoding='utf-8') as f:
+                        json.dump(results, f, indent=2, ensure_ascii=False)
+    finally:
+        if ndjson_file is not None:
+            ndjson_file.close()
+
+    store = LookupStore(args.db, min_interval=args.min_interval)
+    used, max_requests = store.budget_status()
+    search_breaker = SharedCircuitBreaker(store, SEARCH_ENDPOINT)
+    shared_state = {SEARCH_ENDPOINT: {
+        "state": search_breaker.state,
+        "consecutive_failures": search_breaker.consecutive_failures,
+        "min_interval": round(store.current_interval(), 2),
+    }}
+    store.close()
+    elapsed = time.perf_counter() - start
+    print(
+        f"Classificati {len(input_files) - failed}/{len(input_files)} file in {elapsed:.1f}s "
+        f"({args.workers} worker, {lookups} ricerche, {cache_hits} cache hit, "
+        f"budget {used}/{max_requests if max_requests is not None else '∞'})"
+    )
+    for name, totals in summarize_resilience(worker_states, shared_state).items():
+        print(f"{name}: {json.dumps(totals)}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
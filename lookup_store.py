@@ -0,0 +1,363 @@
+"""
+Lookup Store - Stato condiviso tra processi per le ricerche ISIN
+Cache degli identificativi risolti, budget globale di richieste, intervallo adattivo tra richieste
+e circuit breaker su un file SQLite con lock, così N worker non ripetono le stesse ricerche,
+non superano insieme il rate limit e rallentano tutti insieme quando l'endpoint li limita.
+"""
+
+import sqlite3
+import threading
+import time
+import logging
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from resilience import CLOSED, HALF_OPEN, OPEN
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+
+# AIMD sul rate: ogni successo aggiunge questa frazione del rate base, ogni 429 dimezza il rate
+RATE_INCREASE_RATIO = 0.1
+
+
+class BudgetExhaustedError(Exception):
+    """Sollevata quando il budget globale di richieste del run è esaurito"""
+
+
+class LookupStore:
+    """Cache ISIN, budget di richieste e stato degli endpoint condivisi tramite SQLite (una connessione per processo)"""
+
+    def __init__(
+        self,
+        db_path: str,
+        min_interval: float = 2.0,
+        pending_timeout: float = 120.0,
+        poll_interval: float = 0.5,
+        negative_ttl: float = 7 * 24 * 3600,
+    ):
+        self._db_path = db_path
+        self._min_interval = min_interval
+        self._pending_timeout = pending_timeout
+        self._poll_interval = poll_interval
+        # Un "ISIN non trovato" può dipendere dall'indicizzazione del momento: viene ricercato dopo negative_ttl
+        self._negative_ttl = negative_ttl
+        self._lock = threading.RLock()
+        # isolation_level=None: le transazioni sono gestite esplicitamente con BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(db_path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS lookups ("
+            "query TEXT PRIMARY KEY, isin TEXT, status TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        # Token del worker che ha prenotato la query, aggiunto dopo la prima versione dello schema
+        if "owner" not in {row[1] for row in self._conn.execute("PRAGMA table_info(lookups)")}:
+            self._conn.execute("ALTER TABLE lookups ADD COLUMN owner TEXT")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS budget ("
+            "id INTEGER PRIMARY KEY CHECK (id = 1), used INTEGER NOT NULL, "
+            "max_requests INTEGER, next_slot REAL NOT NULL)"
+        )
+        # Intervallo corrente (adattivo) e di base tra due richieste, aggiunti dopo la prima versione dello schema
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(budget)")}
+        for column in ("interval", "base_interval"):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE budget ADD COLUMN {column} REAL")
+        self._conn.execute(
+            "INSERT OR IGNORE INTO budget (id, used, max_requests, next_slot, interval, base_interval) "
+            "VALUES (1, 0, NULL, 0, ?, ?)",
+            (min_interval, min_interval),
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS breakers ("
+            "name TEXT PRIMARY KEY, state TEXT NOT NULL, consecutive_failures INTEGER NOT NULL, "
+            "opened_at REAL NOT NULL, probe_started REAL)"
+        )
+        self.cache_hits = 0
+        self.lookups = 0
+
+    def close(self) -> None:
+        """Chiude la connessione: va fatto esplicitamente, il garbage collector non rilascia i file del database"""
+        self._conn.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Transazione con lock in scrittura su tutto il database (serializza i processi)"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                # Alcuni errori (es. I/O) annullano già la transazione
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def reset_budget(self, max_requests: Optional[int]) -> None:
+        """Azzera budget, intervallo e circuiti all'inizio di un run (max_requests None = nessun limite)"""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE budget SET used = 0, max_requests = ?, next_slot = 0, interval = ?, base_interval = ? WHERE id = 1",
+                (max_requests, self._min_interval, self._min_interval),
+            )
+            conn.execute("DELETE FROM breakers")
+            # Le prenotazioni rimaste da un run interrotto non sono più valide
+            conn.execute("DELETE FROM lookups WHERE status = ?", (STATUS_PENDING,))
+
+    def budget_status(self) -> Tuple[int, Optional[int]]:
+        """Ritorna (richieste usate, massimo consentito)"""
+        with self._lock:
+            return self._conn.execute("SELECT used, max_requests FROM budget WHERE id = 1").fetchone()
+
+    def resolve(self, query: str, lookup: Callable[[], Tuple[Optional[str], bool]]) -> Optional[str]:
+        """
+        Ritorna l'ISIN per la query usando la cache condivisa.
+        Solo il processo che prenota la query esegue lookup(), gli altri attendono il risultato.
+        lookup() ritorna (isin, cacheable): i fallimenti temporanei non vengono salvati.
+        Il budget viene consumato da SharedRateLimiter a ogni tentativo di richiesta.
+        """
+        owner = uuid.uuid4().hex
+        while True:
+            claimed, isin, status = self._claim(query, owner)
+            if status == STATUS_DONE:
+                self.cache_hits += 1
+                return isin
+            if claimed:
+                break
+            # Un altro worker sta già cercando questa query
+            time.sleep(self._poll_interval)
+
+        try:
+            self.lookups += 1
+            # Attesa dello slot, retry e backoff possono superare pending_timeout: la prenotazione va rinnovata
+            with self._heartbeat(query, owner):
+                isin, cacheable = lookup()
+        except BaseException:
+            self._release(query, owner)
+            raise
+
+        if cacheable:
+            with self._transaction() as conn:
+                cursor = conn.execute(
+                    "UPDATE lookups SET isin = ?, status = ?, updated = ? WHERE query = ? AND owner = ?",
+                    (isin, STATUS_DONE, time.time(), query, owner),
+                )
+            if cursor.rowcount == 0:
+                logger.warning(f"Prenotazione di '{query}' persa durante la ricerca, risultato non salvato")
+        else:
+            self._release(query, owner)
+        return isin
+
+    def _claim(self, query: str, owner: str) -> Tuple[bool, Optional[str], Optional[str]]:
+        """
+        Prenota la query se libera, se la prenotazione precedente è scaduta senza essere rinnovata
+        o se il risultato negativo in cache è più vecchio di negative_ttl
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT isin, status, updated FROM lookups WHERE query = ?", (query,)).fetchone()
+            expired = row is not None and (
+                (row[1] == STATUS_PENDING and now - row[2] > self._pending_timeout)
+                or (row[1] == STATUS_DONE and row[0] is None and now - row[2] > self._negative_ttl)
+            )
+            if row is None or expired:
+                conn.execute(
+                    "INSERT OR REPLACE INTO lookups (query, isin, status, updated, owner) VALUES (?, NULL, ?, ?, ?)",
+                    (query, STATUS_PENDING, now, owner),
+                )
+                return True, None, STATUS_PENDING
+            return False, row[0], row[1]
+
+    def _release(self, query: str, owner: str) -> None:
+        """Libera la prenotazione solo se appartiene ancora a owner"""
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM lookups WHERE query = ? AND status = ? AND owner = ?", (query, STATUS_PENDING, owner)
+            )
+
+    def _touch(self, query: str, owner: str) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE lookups SET updated = ? WHERE query = ? AND status = ? AND owner = ?",
+                (time.time(), query, STATUS_PENDING, owner),
+            )
+
+    @contextmanager
+    def _heartbeat(self, query: str, owner: str) -> Iterator[None]:
+        """Rinnova la prenotazione in background finché la ricerca è in corso"""
+        stop = threading.Event()
+
+        def beat() -> None:
+            while not stop.wait(self._pending_timeout / 3):
+                try:
+                    self._touch(query, owner)
+                except sqlite3.Error as e:
+                    logger.warning(f"Rinnovo della prenotazione di '{query}' fallito: {e}")
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def acquire_request(self) -> bool:
+        """Consuma una richiesta dal budget globale e attende il proprio slot (intervallo corrente tra richieste)"""
+        with self._transaction() as conn:
+            used, max_requests, next_slot, interval = conn.execute(
+                "SELECT used, max_requests, next_slot, interval FROM budget WHERE id = 1"
+            ).fetchone()
+            if max_requests is not None and used >= max_requests:
+                return False
+            slot = max(time.time(), next_slot)
+            conn.execute("UPDATE budget SET used = used + 1, next_slot = ? WHERE id = 1", (slot + interval,))
+
+        delay = slot - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        return True
+
+    def on_throttle(self, max_interval: float) -> float:
+        """Raddoppia l'intervallo globale e sposta in avanti il prossimo slot: tutti i worker rallentano"""
+        with self._transaction() as conn:
+            interval, next_slot = conn.execute("SELECT interval, next_slot FROM budget WHERE id = 1").fetchone()
+            interval = min(max_interval, interval * 2)
+            conn.execute(
+                "UPDATE budget SET interval = ?, next_slot = ? WHERE id = 1",
+                (interval, max(next_slot, time.time() + interval)),
+            )
+        return interval
+
+    def on_success(self) -> float:
+        """Aumenta il rate di una frazione del rate base, senza scendere sotto l'intervallo base"""
+        with self._transaction() as conn:
+            interval, base_interval = conn.execute("SELECT interval, base_interval FROM budget WHERE id = 1").fetchone()
+            if interval > base_interval and base_interval > 0:
+                interval = max(base_interval, 1 / (1 / interval + RATE_INCREASE_RATIO / base_interval))
+                conn.execute("UPDATE budget SET interval = ? WHERE id = 1", (interval,))
+        return interval
+
+    def current_interval(self) -> float:
+        with self._lock:
+            return self._conn.execute("SELECT interval FROM budget WHERE id = 1").fetchone()[0]
+
+
+class SharedRateLimiter:
+    """
+    Limiter per resilience.Endpoint condiviso tra processi: ogni tentativo consuma un'unità di budget
+    e uno slot; i 429 allungano l'intervallo globale (AIMD sul rate) invece della concorrenza locale
+    """
+
+    def __init__(self, store: LookupStore, max_interval: float = 60.0):
+        self._store = store
+        self._max_interval = max_interval
+
+    def acquire(self) -> None:
+        if not self._store.acquire_request():
+            raise BudgetExhaustedError("Budget di richieste esaurito")
+
+    def release(self) -> None:
+        pass
+
+    def on_success(self) -> None:
+        self._store.on_success()
+
+    def on_throttle(self) -> None:
+        interval = self._store.on_throttle(self._max_interval)
+        logger.warning(f"Throttling: intervallo globale tra richieste portato a {interval:.1f}s")
+
+    def snapshot(self) -> Dict[str, Any]:
+        used, max_requests = self._store.budget_status()
+        return {
+            "min_interval": round(self._store.current_interval(), 2),
+            "budget_used": used,
+            "budget_max": max_requests,
+        }
+
+
+class SharedCircuitBreaker:
+    """Circuit breaker con lo stato nel LookupStore: un endpoint in errore viene aperto per tutti i worker"""
+
+    def __init__(self, store: LookupStore, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self._store = store
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+
+    def _row(self, conn: sqlite3.Connection) -> Tuple[str, int, float, Optional[float]]:
+        conn.execute(
+            "INSERT OR IGNORE INTO breakers (name, state, consecutive_failures, opened_at, probe_started) "
+            "VALUES (?, ?, 0, 0, NULL)",
+            (self.name, CLOSED),
+        )
+        return conn.execute(
+            "SELECT state, consecutive_failures, opened_at, probe_started FROM breakers WHERE name = ?", (self.name,)
+        ).fetchone()
+
+    @property
+    def state(self) -> str:
+        with self._store._transaction() as conn:
+            return self._row(conn)[0]
+
+    @property
+    def consecutive_failures(self) -> int:
+        with self._store._transaction() as conn:
+            return self._row(conn)[1]
+
+    def is_open(self) -> bool:
+        with self._store._transaction() as conn:
+            state, _, opened_at, _ = self._row(conn)
+            return state == OPEN and time.time() - opened_at < self.recovery_timeout
+
+    def allow_request(self) -> bool:
+        now = time.time()
+        with self._store._transaction() as conn:
+            state, _, opened_at, probe_started = self._row(conn)
+            if state == CLOSED:
+                return True
+            if state == OPEN:
+                if now - opened_at < self.recovery_timeout:
+                    return False
+                probe_started = None
+            # Half-open: una sola richiesta di prova alla volta tra tutti i processi
+            # (una prova più vecchia di recovery_timeout è di un worker terminato)
+            if probe_started is not None and now - probe_started < self.recovery_timeout:
+                return False
+            conn.execute(
+                "UPDATE breakers SET state = ?, probe_started = ? WHERE name = ?", (HALF_OPEN, now, self.name)
+            )
+            return True
+
+    def record_success(self) -> None:
+        with self._store._transaction() as conn:
+            self._row(conn)
+            conn.execute(
+                "UPDATE breakers SET state = ?, consecutive_failures = 0, probe_started = NULL WHERE name = ?",
+                (CLOSED, self.name),
+            )
+
+    def release_probe(self) -> None:
+        with self._store._transaction() as conn:
+            self._row(conn)
+            conn.execute("UPDATE breakers SET probe_started = NULL WHERE name = ?", (self.name,))
+
+    def record_failure(self) -> None:
+        with self._store._transaction() as conn:
+            state, failures, _, _ = self._row(conn)
+            failures += 1
+            if state == HALF_OPEN or failures >= self.failure_threshold:
+                conn.execute(
+                    "UPDATE breakers SET state = ?, consecutive_failures = ?, opened_at = ?, probe_started = NULL "
+                    "WHERE name = ?",
+                    (OPEN, failures, time.time(), self.name),
+                )
+            else:
+                conn.execute(
+                    "UPDATE breakers SET consecutive_failures = ?, probe_started = NULL WHERE name = ?",
+                    (failures, self.name),
+                )
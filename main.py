@@ -1,7 +1,10 @@
 from argparse import ArgumentParser
 import json
+import os
 
 from ocr import OcrChain
+from pdf import PdfReader
+import resilience
 from test import Classificationator
 
 """source $(poetry env info --path)/bin/activate"""
@@ -25,21 +28,80 @@ def main():
         default=0.0,
         help="The temperature to use for the chat.",
     )
-    parser.add_argument(
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group.add_argument(
         "--input-image",
         type=str,
-        required=True,
         help="The image to perform OCR on.",
     )
+    input_group.add_argument(
+        "--input-pdf",
+        type=str,
+        help="The PDF statement to process (text pages are parsed locally, scanned pages go through OCR).",
+    )
+    parser.add_argument(
+        "--dpi",
+        type=int,
+        default=200,
+        help="The DPI used to rasterize PDF pages without a text layer.",
+    )
+    parser.add_argument(
+        "--pdf-workers",
+        type=int,
+        default=4,
+        help="The number of PDF pages sent to the model concurrently.",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Use the compact [key, value] row output format to reduce output tokens.",
+    )
+    parser.add_argument(
+        "--max-tokens",
+        type=int,
+        default=None,
+        help="The output token budget per image (default: derived from image size and expected rows).",
+    )
+    parser.add_argument(
+        "--expected-rows",
+        type=int,
+        default=None,
+        help="The expected number of asset rows per image, used to size the output token budget.",
+    )
     args = parser.parse_args()
     
     try:
-        ocr_chain = OcrChain(
-            model=args.model,
-            api_key=args.api_key,
-            temperature=args.temperature,
-        )
-        result = ocr_chain.invoke(args.input_image)
+        # Un PDF interamente testuale non richiede il modello: senza API key le pagine scansionate vengono segnalate
+        if args.input_pdf and not (args.api_key or os.getenv("OPENROUTER_API_KEY")):
+            ocr_chain = None
+        else:
+            ocr_chain = OcrChain(
+                model=args.model,
+                api_key=args.api_key,
+                temperature=args.temperature,
+                compact=args.compact,
+                max_tokens=args.max_tokens,
+                expected_rows=args.expected_rows,
+            )
+        if args.input_pdf:
+            pdf_reader = PdfReader(ocr_chain, dpi=args.dpi, max_workers=args.pdf_workers)
+            result = pdf_reader.read(args.input_pdf)
+            print(f"\n📄 Vision calls for PDF: {pdf_reader.vision_calls}")
+            if result["failed_pages"]:
+                print(f"⚠️  Pages not processed (assets missing from the result): {result['failed_pages']}")
+        else:
+            result = ocr_chain.invoke(args.input_image)
+
+        # Le pagine PDF terminano in ordine sparso: ogni riga riporta la propria sorgente
+        for i, stats in enumerate(ocr_chain.stats if ocr_chain else [], start=1):
+            tokens = f"{stats.output_tokens}" if stats.output_tokens_measured else f"~{stats.output_tokens} (estimated)"
+            line = (
+                f"⏱️  Image {i} ({stats.source or 'in memory'}): {stats.latency_s}s, {tokens} output tokens "
+                f"(budget: {stats.max_tokens or 'none'}), {stats.rows} rows, stop: {stats.stop_reason}"
+            )
+            if stats.saved_tokens_estimate is not None:
+                line += f", ~{stats.saved_tokens_estimate} tokens saved vs verbose (chars/4 estimate)"
+            print(line)
 
         print("\n" + "="*50)
         print("📊 OCR RESULT")
@@ -65,6 +127,10 @@ def main():
         print(f"Errore nel parsing JSON: {e}")
     except Exception as e:
         print(f"Errore generale: {e}")
+    finally:
+        # Stato di circuit breaker e retry, utile anche quando la run fallisce
+        for name, state in resilience.snapshot().items():
+            print(f"🔌 {name}: {json.dumps(state)}")
 
 if __name__ == "__main__":
     main()
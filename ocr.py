@@ -1,9 +1,12 @@
-from typing import Optional, Any
+from typing import Optional, Any, Union, List, Tuple
+from dataclasses import dataclass
 import io
 import base64
 import json
 import re
 import os
+import time
+import logging
 from dotenv import load_dotenv
 
 from langchain_core.runnables import Runnable, RunnableConfig
@@ -11,54 +14,197 @@ from langchain_core.runnables.utils import Input, Output
 from langchain_openai import ChatOpenAI
 from PIL import Image
 
+from ocr_output import MAX_CHARS_WITHOUT_ROW, MAX_LEADING_CHARS, dump_rows, estimate_token_budget, estimate_tokens, find_loop_start, parse_rows
 from prompt import create_ocr_prompt
+from resilience import get_endpoint
+
+# Endpoint OCR con retry, circuit breaker e concorrenza adattiva
+OCR_ENDPOINT = "openrouter"
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class OcrStats:
+    """Statistiche di una singola chiamata OCR"""
+    latency_s: float
+    output_tokens: int
+    output_tokens_measured: bool  # False se il provider non ha restituito l'usage (stima chars/4)
+    compact: bool
+    verbose_tokens_estimate: int
+    compact_tokens_estimate: int
+    max_tokens: Optional[int]
+    rows: int
+    stop_reason: str  # 'complete', 'loop', 'malformed' oppure 'budget'
+    source: Optional[str] = None  # file immagine o pagina PDF di provenienza
+
+    @property
+    def saved_tokens_estimate(self) -> Optional[int]:
+        """Stima chars/4 dei token risparmiati rispetto al formato verboso (solo in modalità compatta)"""
+        if not self.compact:
+            return None
+        return self.verbose_tokens_estimate - self.compact_tokens_estimate
+
 
 class OcrChain(Runnable[Input, Output]):
-    def __init__(self, model: str, api_key: str, temperature: float):
+    def __init__(
+        self,
+        model: str,
+        api_key: str,
+        temperature: float,
+        compact: bool = False,
+        max_tokens: Optional[int] = None,
+        expected_rows: Optional[int] = None,
+    ):
         # Use provided API key or fall back to environment variable
         openrouter_api_key = api_key if api_key else os.getenv("OPENROUTER_API_KEY")
-        
+
         if not openrouter_api_key:
             raise ValueError("OpenRouter API key is required. Provide it as parameter or set OPENROUTER_API_KEY environment variable.")
-        
+
         self._llm = ChatOpenAI(
             model=model,
             api_key=openrouter_api_key,
             base_url="https://openrouter.ai/api/v1",
             temperature=temperature,
+            stream_usage=True,
+            # I retry sono gestiti da resilience, non dal client openai
+            max_retries=0,
         )
-        self._ocr_prompt = create_ocr_prompt()
+        self._compact = compact
+        self._max_tokens = max_tokens
+        self._expected_rows = expected_rows
+        self._ocr_prompt = create_ocr_prompt(compact=compact)
+        self.stats: List[OcrStats] = []
 
-    def invoke(self, image_filename: str, config: Optional[RunnableConfig] = None, **kwargs: Any) -> str:
-        image_data = self._read_image(image_filename)
+    def invoke(
+        self,
+        image_filename: Union[str, Image.Image],
+        config: Optional[RunnableConfig] = None,
+        source: Optional[str] = None,
+        **kwargs: Any,
+    ) -> str:
+        # source identifica l'immagine nelle statistiche (le chiamate parallele terminano in ordine sparso)
+        if isinstance(image_filename, Image.Image):
+            image = image_filename
+        else:
+            image = Image.open(image_filename)
+            source = source or image_filename
+        image_data = self._read_image(image)
         input_data = {"image_data": image_data}
-        response = self._create_chain().invoke(input_data, config, **kwargs).content
-        return self._extract_json(response)
+        # Il budget stimato si applica solo al formato compatto; in quello verboso solo se esplicito
+        max_tokens = self._max_tokens
+        if max_tokens is None and self._compact:
+            max_tokens = estimate_token_budget(*image.size, self._expected_rows, self._compact)
+
+        start = time.perf_counter()
+        response, output_tokens, stop_reason = get_endpoint(OCR_ENDPOINT).call(
+            lambda: self._stream(input_data, max_tokens, config, **kwargs)
+        )
+        latency = time.perf_counter() - start
 
-    def _extract_json(self, response: str) -> str:
+        if stop_reason != 'complete':
+            logger.warning(
+                f"Output OCR interrotto ({stop_reason}, budget {max_tokens} token): "
+                f"restano solo le righe complete, alcune posizioni potrebbero mancare"
+            )
+        result = self._extract_json(response, stop_reason)
+        self._record_stats(result, latency, output_tokens, max_tokens, stop_reason, source)
+        return result
+
+    def _stream(self, input_data: dict, max_tokens: Optional[int], config: Optional[RunnableConfig], **kwargs: Any) -> Tuple[str, Optional[int], str]:
+        """Legge la risposta in streaming interrompendola se diventa malformata o entra in loop"""
+        response = ""
+        output_tokens = None
+        last_row_end = 0
+        rows_seen = 0
+
+        for chunk in self._create_chain(max_tokens).stream(input_data, config, **kwargs):
+            if chunk.usage_metadata:
+                output_tokens = chunk.usage_metadata.get("output_tokens", output_tokens)
+            text = chunk.content if isinstance(chunk.content, str) else ""
+            response += text
+
+            if '{' not in response and len(response) > MAX_LEADING_CHARS:
+                return response, output_tokens, 'malformed'
+
+            # Rianalizza le righe solo quando il chunk può averne chiusa una
+            if (']' if self._compact else '}') in text:
+                rows = parse_rows(response, self._compact)
+            else:
+                rows = None
+            if rows is not None and len(rows) != rows_seen:
+                rows_seen = len(rows)
+                last_row_end = len(response)
+                if find_loop_start(rows) is not None:
+                    return response, output_tokens, 'loop'
+            elif len(response) - last_row_end > MAX_CHARS_WITHOUT_ROW:
+                return response, output_tokens, 'malformed'
+
+        if max_tokens is not None and output_tokens is not None and output_tokens >= max_tokens:
+            return response, output_tokens, 'budget'
+        return response, output_tokens, 'complete'
+
+    def _extract_json(self, response: str, stop_reason: str = 'complete') -> str:
         """Extract JSON from response, handling cases where model includes extra text"""
         # Try to find JSON in the response
         json_match = re.search(r'\{.*\}', response, re.DOTALL)
-        if json_match:
+        if json_match and stop_reason == 'complete':
             try:
                 # Validate that it's valid JSON
                 json.loads(json_match.group())
                 return json_match.group()
             except json.JSONDecodeError:
                 pass
-        
+
+        # Output troncato o non valido: ricostruisci dalle sole righe complete
+        rows = parse_rows(response, self._compact)
+        if rows:
+            loop_start = find_loop_start(rows)
+            if loop_start is not None:
+                rows = rows[:loop_start]
+            return dump_rows(rows, self._compact)
+
         # If no valid JSON found, return the original response
         return response
 
-    def _create_chain(self) -> Runnable:
-        return self._ocr_prompt|self._llm
+    def _record_stats(
+        self,
+        result: str,
+        latency: float,
+        output_tokens: Optional[int],
+        max_tokens: Optional[int],
+        stop_reason: str,
+        source: Optional[str],
+    ) -> None:
+        """Confronta il costo in token del risultato nei due formati"""
+        rows = parse_rows(result, self._compact)
+        compact_estimate = estimate_tokens(dump_rows(rows, compact=True))
+        verbose_estimate = estimate_tokens(dump_rows(rows, compact=False))
+        self.stats.append(OcrStats(
+            latency_s=round(latency, 3),
+            output_tokens=output_tokens if output_tokens is not None else estimate_tokens(result),
+            output_tokens_measured=output_tokens is not None,
+            compact=self._compact,
+            verbose_tokens_estimate=verbose_estimate,
+            compact_tokens_estimate=compact_estimate,
+            max_tokens=max_tokens,
+            rows=len(rows),
+            stop_reason=stop_reason,
+            source=source,
+        ))
+
+    def _create_chain(self, max_tokens: Optional[int]) -> Runnable:
+        if max_tokens is None:
+            return self._ocr_prompt|self._llm
+        return self._ocr_prompt|self._llm.bind(max_tokens=max_tokens)
 
-    def _read_image(self, image_filename: str) -> str:
-        file = Image.open(image_filename)
+    def _read_image(self, image_filename: Union[str, Image.Image]) -> str:
+        # Accetta sia un percorso che un'immagine già in memoria (es. pagina PDF rasterizzata)
+        file = image_filename if isinstance(image_filename, Image.Image) else Image.open(image_filename)
         buf = io.BytesIO()
         file.save(buf, format="PNG")
         return base64.b64encode(buf.getvalue()).decode("utf-8")
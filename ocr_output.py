@@ -0,0 +1,85 @@
+"""
+OCR Output - Analisi dell'output del modello OCR senza dipendenze esterne
+Estrazione delle righe complete da un output anche parziale, rilevamento dei loop
+e stima del budget di token di output.
+"""
+
+import json
+import re
+from typing import Any, List, Optional, Tuple
+
+# Righe complete nei due formati di output: [chiave, valore] (compatto) e {chiave: valore} (verboso)
+_JSON_STRING = r'"(?:[^"\\]|\\.)*"'
+_JSON_VALUE = r'null|' + _JSON_STRING + r'|-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?'
+COMPACT_ROW_PATTERN = re.compile(r'\[\s*(' + _JSON_STRING + r')\s*,\s*(' + _JSON_VALUE + r')\s*\]')
+VERBOSE_ROW_PATTERN = re.compile(r'\{\s*(' + _JSON_STRING + r')\s*:\s*(' + _JSON_VALUE + r')\s*\}')
+
+# Stima approssimativa dei token generati per riga e dell'altezza in pixel di una riga
+TOKENS_PER_ROW = {True: 14, False: 20}
+ROW_HEIGHT_PX = 28
+MIN_ROWS, MAX_ROWS = 10, 300
+# Margine sul budget stimato: meglio qualche token in più che righe troncate
+BUDGET_HEADROOM = 3.0
+
+# Soglie di interruzione anticipata dello stream
+LOOP_MIN_REPEATS = 4
+# Più lotti dello stesso titolo con la stessa quantità sono legittimi: una sola riga ripetuta
+# è un loop solo oltre questa soglia
+LOOP_MIN_SINGLE_REPEATS = 10
+MAX_LEADING_CHARS = 200
+MAX_CHARS_WITHOUT_ROW = 400
+
+
+def estimate_tokens(text: str) -> int:
+    """Stima grossolana dei token (circa 4 caratteri per token)"""
+    return max(1, len(text) // 4)
+
+
+def estimate_token_budget(width: int, height: int, expected_rows: Optional[int] = None, compact: bool = False) -> int:
+    """
+    Calcola il budget di token di output a partire dalla dimensione dell'immagine
+    e dal numero di righe atteso (stimato dall'altezza se non fornito)
+    """
+    rows = expected_rows if expected_rows else height // ROW_HEIGHT_PX
+    rows = min(max(rows, MIN_ROWS), MAX_ROWS)
+    # Immagini più larghe tendono ad avere nomi più lunghi
+    width_factor = min(max(width / 1000, 0.75), 2.0)
+    per_row = TOKENS_PER_ROW[compact] * width_factor
+    return int(32 + rows * per_row * BUDGET_HEADROOM)
+
+
+def parse_rows(text: str, compact: bool) -> List[Tuple[str, Any]]:
+    """Estrae le righe complete (chiave, valore) da un output anche parziale"""
+    pattern = COMPACT_ROW_PATTERN if compact else VERBOSE_ROW_PATTERN
+    return [(json.loads(key), json.loads(value)) for key, value in pattern.findall(text)]
+
+
+def dump_rows(rows: List[Tuple[str, Any]], compact: bool) -> str:
+    """Serializza le righe nel formato {"assets": [...]} compatto o verboso"""
+    if compact:
+        return json.dumps({"assets": [[key, value] for key, value in rows]}, ensure_ascii=False, separators=(',', ':'))
+    return json.dumps({"assets": [{key: value} for key, value in rows]}, ensure_ascii=False)
+
+
+def find_loop_start(
+    rows: List[Tuple[str, Any]],
+    min_repeats: int = LOOP_MIN_REPEATS,
+    min_single_repeats: int = LOOP_MIN_SINGLE_REPEATS,
+) -> Optional[int]:
+    """
+    Rileva se le ultime righe ripetono lo stesso blocco (periodo 1-3) almeno min_repeats volte
+    (min_single_repeats per una singola riga).
+    Ritorna l'indice da cui troncare (mantenendo una sola occorrenza del blocco), altrimenti None.
+    """
+    for period in range(1, 4):
+        needed = min_single_repeats if period == 1 else min_repeats
+        if len(rows) < period * needed:
+            continue
+        block = rows[-period:]
+        # Conta tutte le ripetizioni consecutive, non solo le ultime needed
+        repeats = 1
+        while len(rows) >= (repeats + 1) * period and rows[-(repeats + 1) * period:-repeats * period] == block:
+            repeats += 1
+        if repeats >= needed:
+            return len(rows) - repeats * period + period
+    return None
@@ -0,0 +1,150 @@
+"""
+PDF Reader - Ingestione di estratti conto PDF
+Le pagine con testo estraibile vengono analizzate localmente (nessuna chiamata LLM),
+solo le pagine scansionate vengono rasterizzate e inviate a OcrChain in parallelo.
+"""
+
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional, Union
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from ocr import OcrChain
+from pdf_text import parse_words
+
+logger = logging.getLogger(__name__)
+
+# Numero minimo di caratteri perché una pagina sia considerata "testuale"
+MIN_TEXT_CHARS = 20
+# Frazione della pagina coperta da immagini oltre la quale la pagina è una scansione
+SCAN_IMAGE_COVERAGE = 0.5
+
+
+@dataclass
+class PdfPageResult:
+    """Risultato dell'elaborazione di una singola pagina"""
+    page_number: int
+    source: str  # 'text' oppure 'vision'
+    assets: List[dict] = field(default_factory=list)
+    error_message: Optional[str] = None
+
+
+def rasterize_page(page: "fitz.Page", dpi: int) -> Image.Image:
+    """Rasterizza una pagina PDF a un DPI controllato"""
+    pixmap = page.get_pixmap(dpi=dpi, alpha=False)
+    return Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+
+
+def image_coverage(page: "fitz.Page") -> float:
+    """Frazione dell'area della pagina coperta da immagini (le sovrapposizioni possono sovrastimarla)"""
+    page_area = page.rect.width * page.rect.height
+    if page_area <= 0:
+        return 0.0
+    covered = 0.0
+    for info in page.get_image_info():
+        bbox = fitz.Rect(info["bbox"]) & page.rect
+        if not bbox.is_empty:
+            covered += bbox.width * bbox.height
+    return min(1.0, covered / page_area)
+
+
+def is_scanned_page(page: "fitz.Page", text: str) -> bool:
+    """Una pagina è una scansione se non ha testo o se un'immagine ne copre la maggior parte"""
+    return len(text.strip()) < MIN_TEXT_CHARS or image_coverage(page) >= SCAN_IMAGE_COVERAGE
+
+
+class PdfReader:
+    """Legge un PDF e produce la struttura {"assets": [...]} attesa da Classificationator"""
+
+    def __init__(self, ocr_chain: Optional[OcrChain] = None, dpi: int = 200, max_workers: int = 4):
+        self._ocr_chain = ocr_chain
+        self._dpi = dpi
+        self._max_workers = max_workers
+        self.vision_calls = 0
+
+    def read(self, pdf_filename: str) -> dict:
+        """
+        Processa tutte le pagine e unisce gli asset in ordine di pagina.
+        "failed_pages" elenca (da 1) le pagine non elaborate, i cui asset mancano dal risultato.
+        """
+        page_results = self.read_pages(pdf_filename)
+        assets, failed_pages = [], []
+        for page_result in page_results:
+            assets.extend(page_result.assets)
+            if page_result.error_message is not None:
+                failed_pages.append(page_result.page_number + 1)
+        return {"assets": assets, "failed_pages": failed_pages}
+
+    def read_pages(self, pdf_filename: str) -> List[PdfPageResult]:
+        """Analizza localmente le pagine testuali e invia in parallelo le altre a OcrChain"""
+        results: List[PdfPageResult] = []
+        scanned_pages = []
+
+        with fitz.open(pdf_filename) as document:
+            for page in document:
+                text = page.get_text("text")
+                if len(text.strip()) >= MIN_TEXT_CHARS:
+                    # Le parole con la loro posizione permettono di ricostruire righe e colonne
+                    assets = parse_words(page.get_text("words"))
+                    # Pagine testuali senza posizioni (copertina, note legali, glossario) restano vuote
+                    if assets or not is_scanned_page(page, text):
+                        results.append(PdfPageResult(page.number, 'text', assets))
+                        continue
+                    # Scansione con un po' di testo OCR (timbro, intestazione): serve il modello vision
+                    logger.info(f"Pagina {page.number + 1} scansionata con testo parziale, uso il modello vision")
+                scanned_pages.append(page.number)
+
+            if scanned_pages and self._ocr_chain is None:
+                results.extend(
+                    PdfPageResult(page_number, 'vision', error_message="OcrChain non configurato (manca la API key)")
+                    for page_number in scanned_pages
+                )
+            elif scanned_pages:
+                self.vision_calls += len(scanned_pages)
+                results.extend(self._ocr_pages(document, scanned_pages))
+
+        logger.info(
+            f"PDF {pdf_filename}: {len(results) - len(scanned_pages)} pagine testuali, "
+            f"{len(scanned_pages)} pagine inviate al modello"
+        )
+        return sorted(results, key=lambda r: r.page_number)
+
+    def _ocr_pages(self, document: "fitz.Document", page_numbers: List[int]) -> List[PdfPageResult]:
+        """
+        Rasterizza le pagine una alla volta sul thread chiamante (PyMuPDF non è thread-safe)
+        e le invia al modello in parallelo, con al più max_workers immagini in memoria
+        """
+        slots = threading.BoundedSemaphore(self._max_workers)
+        futures = []
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            for page_number in page_numbers:
+                slots.acquire()
+                try:
+                    image = rasterize_page(document[page_number], self._dpi)
+                    future = executor.submit(self._ocr_page, page_number, image)
+                except BaseException:
+                    slots.release()
+                    raise
+                future.add_done_callback(lambda _: slots.release())
+                futures.append(future)
+        return [future.result() for future in futures]
+
+    def _ocr_page(self, page_number: int, image: Image.Image) -> PdfPageResult:
+        """Invia una pagina rasterizzata al modello vision"""
+        try:
+            data = self._load_assets(self._ocr_chain.invoke(image, source=f"pagina {page_number + 1}"))
+            return PdfPageResult(page_number, 'vision', data)
+        except Exception as e:
+            logger.error(f"Errore OCR sulla pagina {page_number + 1}: {e}")
+            return PdfPageResult(page_number, 'vision', error_message=str(e))
+
+    @staticmethod
+    def _load_assets(response: Union[str, dict]) -> List[dict]:
+        data = json.loads(response) if isinstance(response, str) else response
+        assets = data.get("assets", []) if isinstance(data, dict) else []
+        return assets if isinstance(assets, list) else []
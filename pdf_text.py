@@ -0,0 +1,183 @@
+"""
+PDF Text - Analisi locale del testo estraibile di un estratto conto
+Le parole vengono raggruppate in righe e colonne in base alla posizione (x/y),
+una riga è una posizione solo se ha un ISIN oppure un nome e un importo in colonna.
+"""
+
+import re
+from typing import List, Optional, Sequence, Tuple
+
+# Celle che sono solo intestazioni di colonna o di pagina (match sull'intera cella)
+HEADER_CELL_PATTERN = re.compile(
+    r'^(?:totale|total|quantity|quantità|p/l|gain|return|valorizzazione|liquidità|investimento|'
+    r'data|date|saldo|commissioni|descrizione|description|titolo|strumento|controvalore|'
+    r'pagina|page)'
+    r'(?:\s+(?:portafoglio|portfolio|complessivo|generale|value|valore|\d+(?:\s+(?:di|of)\s+\d+)?))?\s*:?$',
+    re.IGNORECASE,
+)
+
+# Righe di riepilogo, saldi, liquidità, costi e imposte: basta la parola iniziale, qualunque cosa segua
+SUMMARY_ROW_PATTERN = re.compile(
+    r'^(?:totale|totali|total|subtotale|subtotal|controvalore|saldo|liquidità|liquidita|disponibilità|'
+    r'commissioni|commissione|spese|imposta|imposte|bollo|ritenuta|ritenute|tasse|interessi|'
+    r'valorizzazione|investimento|rendimento|performance)\b',
+    re.IGNORECASE,
+)
+# Titoli reali che iniziano con una di quelle parole (le righe con ISIN non passano da qui)
+SUMMARY_ALLOWLIST = re.compile(r'^(?:total\s+(?:se|sa|gabon)|totalenergies)\b', re.IGNORECASE)
+
+ISIN_PATTERN = re.compile(r'\b([A-Z]{2}[A-Z0-9]{9}[0-9])\b')
+DATE_PATTERN = re.compile(r'\b\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}\b|\b\d{4}-\d{2}-\d{2}\b|\b\d{1,2}:\d{2}(?::\d{2})?\b')
+
+# Un importo monetario ha separatori delle migliaia o due decimali: esclude CAP, numeri di conto e telefoni
+AMOUNT_PATTERN = re.compile(r'^\d{1,3}(?:[.,\'’]\d{3})+(?:[.,]\d{1,2})?$|^\d+[.,]\d{2}$')
+PERCENT_PATTERN = re.compile(r'^[+-]?\d+(?:[.,]\d+)?%$')
+SIGNED_PATTERN = re.compile(r'^[+-]\d')
+CURRENCY_SYMBOLS = '€$£'
+CURRENCY_CODES = {'EUR', 'USD', 'GBP', 'CHF', 'JPY'}
+
+# Colonne separate da uno spazio più largo di questa frazione dell'altezza della riga
+CELL_GAP_RATIO = 0.8
+# Due parole sono sulla stessa riga se i centri verticali distano meno di questa frazione dell'altezza
+ROW_TOLERANCE_RATIO = 0.5
+
+# (x0, y0, x1, y1, parola, ...) come restituito da page.get_text("words")
+Word = Tuple
+
+
+def parse_number(raw: str) -> Optional[float]:
+    """Normalizza un numero (separatori migliaia, virgola decimale) in float"""
+    cleaned = raw.replace(' ', '').replace("'", '').replace('’', '').lstrip('+')
+    if not cleaned:
+        return None
+
+    last_dot, last_comma = cleaned.rfind('.'), cleaned.rfind(',')
+    if last_dot != -1 and last_comma != -1:
+        # Il separatore più a destra è quello decimale
+        if last_comma > last_dot:
+            cleaned = cleaned.replace('.', '').replace(',', '.')
+        else:
+            cleaned = cleaned.replace(',', '')
+    else:
+        # Un solo tipo di separatore: decimale, salvo gruppi di esattamente 3 cifre (migliaia)
+        separator = ',' if last_comma != -1 else '.'
+        position = max(last_dot, last_comma)
+        integer_part = cleaned[:position].lstrip('-')
+        if position != -1 and (cleaned.count(separator) > 1 or (len(cleaned) - position - 1 == 3 and integer_part not in ('', '0'))):
+            cleaned = cleaned.replace(separator, '')
+        else:
+            cleaned = cleaned.replace(',', '.')
+
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+
+def _strip_currency(token: str) -> str:
+    return token.strip(CURRENCY_SYMBOLS + ' ')
+
+
+def _is_value_token(token: str) -> bool:
+    """Token che appartiene alle colonne numeriche (importi, percentuali, variazioni)"""
+    cleaned = _strip_currency(token)
+    return bool(AMOUNT_PATTERN.match(cleaned) or PERCENT_PATTERN.match(cleaned) or SIGNED_PATTERN.match(cleaned))
+
+
+def _is_summary_or_header(cell: str) -> bool:
+    """Intestazione di colonna oppure riga di totale/saldo/costi (salvo titoli noti come "Total SE")"""
+    if HEADER_CELL_PATTERN.match(cell):
+        return True
+    return bool(SUMMARY_ROW_PATTERN.match(cell)) and not SUMMARY_ALLOWLIST.match(cell)
+
+
+def parse_holdings_cells(cells: Sequence[str]) -> Optional[dict]:
+    """
+    Estrae {chiave: valore} da una riga già divisa in celle (colonne).
+    Chiave = ISIN se presente, altrimenti la prima cella con testo, troncata al primo importo.
+    Valore = ultimo importo monetario, oppure la percentuale se è l'unico dato, altrimenti None.
+    """
+    cells = [' '.join(DATE_PATTERN.sub(' ', cell).split()) for cell in cells]
+    cells = [cell for cell in cells if cell]
+    if not cells:
+        return None
+
+    isin_match = ISIN_PATTERN.search(' '.join(cells))
+    isin = isin_match.group(1) if isin_match else None
+
+    amounts, percentages = [], []
+    for cell in cells:
+        for token in cell.split():
+            cleaned = _strip_currency(token)
+            # Variazioni con segno (+1,2 / -3%) non sono né valorizzazioni né pesi
+            if SIGNED_PATTERN.match(cleaned):
+                continue
+            if PERCENT_PATTERN.match(cleaned):
+                percentages.append(cleaned)
+            elif AMOUNT_PATTERN.match(cleaned):
+                amounts.append(parse_number(cleaned))
+
+    if isin:
+        key = isin
+    else:
+        name_cell = next((cell for cell in cells if re.search(r'[A-Za-zÀ-ÿ]', cell)), None)
+        if name_cell is None or _is_summary_or_header(name_cell):
+            return None
+        name_tokens = []
+        for token in name_cell.split():
+            if _is_value_token(token) or token.upper() in CURRENCY_CODES or not _strip_currency(token):
+                break
+            name_tokens.append(token)
+        key = ' '.join(name_tokens).strip(' -:;|')
+        # Senza ISIN serve un nome e un importo (o un peso) in colonna
+        if not re.search(r'[A-Za-zÀ-ÿ]', key) or _is_summary_or_header(key) or not (amounts or percentages):
+            return None
+
+    if amounts:
+        return {key: amounts[-1]}
+    if len(percentages) == 1:
+        return {key: percentages[0]}
+    return {key: None}
+
+
+def parse_holdings_line(line: str) -> Optional[dict]:
+    """Come parse_holdings_cells per una riga di testo: le colonne sono separate da tab o 2+ spazi"""
+    return parse_holdings_cells(re.split(r'\t|\s{2,}', line.strip()))
+
+
+def group_words(words: Sequence[Word]) -> List[List[str]]:
+    """Raggruppa le parole di una pagina in righe (per y) e ogni riga in celle (per distanza in x)"""
+    rows: List[List[Word]] = []
+    for word in sorted(words, key=lambda w: ((w[1] + w[3]) / 2, w[0])):
+        center, height = (word[1] + word[3]) / 2, word[3] - word[1]
+        if rows:
+            last = rows[-1][0]
+            last_center, last_height = (last[1] + last[3]) / 2, last[3] - last[1]
+            if abs(center - last_center) <= ROW_TOLERANCE_RATIO * max(height, last_height):
+                rows[-1].append(word)
+                continue
+        rows.append([word])
+
+    table = []
+    for row in rows:
+        row.sort(key=lambda w: w[0])
+        height = max(w[3] - w[1] for w in row)
+        cells, current = [], [row[0][4]]
+        for previous, word in zip(row, row[1:]):
+            if word[0] - previous[2] > CELL_GAP_RATIO * height:
+                cells.append(' '.join(current))
+                current = []
+            current.append(word[4])
+        cells.append(' '.join(current))
+        table.append(cells)
+    return table
+
+
+def parse_words(words: Sequence[Word]) -> List[dict]:
+    """Estrae gli asset da tutte le righe di una pagina a partire dalle parole posizionate"""
+    assets = []
+    for cells in group_words(words):
+        asset = parse_holdings_cells(cells)
+        if asset:
+            assets.append(asset)
+    return assets
@@ -0,0 +1,258 @@
+"""
+Resilience - Retry, circuit breaker e concorrenza adattiva per le chiamate di rete
+Usato sia per OcrChain (OpenRouter) che per la ricerca ISIN (Google).
+"""
+
+import random
+import threading
+import time
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Sollevata quando il circuito di un endpoint è aperto e la chiamata viene rifiutata subito"""
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    """Estrae lo status HTTP da eccezioni openai/httpx/requests, se presente"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_throttle(error: BaseException) -> bool:
+    return _status_code(error) == 429
+
+
+def is_transient(error: BaseException) -> bool:
+    """Throttling, errori 5xx, timeout e problemi di connessione sono ritentabili"""
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """Legge l'header Retry-After (in secondi) se il server lo fornisce"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class RetryPolicy:
+    """Backoff esponenziale con full jitter"""
+    max_attempts: int = 4
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+
+    def delay(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        retry_after = _retry_after(error) if error is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Apre il circuito dopo failure_threshold errori consecutivi e riprova dopo recovery_timeout"""
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self.opened_at < self.recovery_timeout
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.recovery_timeout:
+                    return False
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+            # Half-open: una sola richiesta di prova alla volta
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Libera la richiesta di prova senza cambiare lo stato (esito non significativo per l'endpoint)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+
+class AdaptiveLimiter:
+    """Limite di concorrenza AIMD: +1/limit a ogni successo, dimezzato a ogni throttling"""
+
+    def __init__(self, initial: int = 4, min_limit: int = 1, max_limit: int = 16):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self) -> None:
+        with self._condition:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def on_throttle(self) -> None:
+        with self._condition:
+            self.limit = max(self.min_limit, self.limit / 2)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"concurrency_limit": round(self.limit, 2)}
+
+
+class Endpoint:
+    """
+    Combina retry, circuit breaker e limiter per un singolo endpoint, con contatori esposti.
+    Breaker e limiter sono sostituibili con versioni condivise tra processi (vedi lookup_store).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        policy: Optional[RetryPolicy] = None,
+        breaker=None,
+        limiter=None,
+    ):
+        self.name = name
+        self.policy = policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter or AdaptiveLimiter()
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self.short_circuited = 0
+        self._lock = threading.Lock()
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def call(self, fn: Callable[[], Any]) -> Any:
+        """Esegue fn con retry sugli errori temporanei; solleva CircuitOpenError se il circuito è aperto"""
+        self._count("calls")
+        for attempt in range(self.policy.max_attempts):
+            if not self.breaker.allow_request():
+                self._count("short_circuited")
+                raise CircuitOpenError(f"Circuito aperto per {self.name}")
+
+            try:
+                # Ogni tentativo, retry compresi, passa dal limiter (e dall'eventuale budget condiviso)
+                self.limiter.acquire()
+            except Exception:
+                self.breaker.release_probe()
+                raise
+            try:
+                result = fn()
+            except Exception as e:
+                if not is_transient(e):
+                    # Errore non di rete (es. 400/401): non dice nulla sulla salute dell'endpoint
+                    self.breaker.release_probe()
+                    raise
+                self.breaker.record_failure()
+                if is_throttle(e):
+                    self._count("throttled")
+                    self.limiter.on_throttle()
+                if attempt == self.policy.max_attempts - 1:
+                    self._count("failures")
+                    raise
+                delay = self.policy.delay(attempt, e)
+                self._count("retries")
+                logger.warning(f"{self.name}: tentativo {attempt + 1} fallito ({e}), nuovo tentativo tra {delay:.1f}s")
+            else:
+                self.breaker.record_success()
+                self.limiter.on_success()
+                return result
+            finally:
+                self.limiter.release()
+            time.sleep(delay)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            **self.limiter.snapshot(),
+            "calls": self.calls,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "failures": self.failures,
+            "short_circuited": self.short_circuited,
+        }
+
+
+_endpoints: Dict[str, Endpoint] = {}
+_endpoints_lock = threading.Lock()
+
+
+def get_endpoint(name: str) -> Endpoint:
+    """Ritorna l'Endpoint condiviso (per processo) con il nome dato, creandolo se necessario"""
+    with _endpoints_lock:
+        if name not in _endpoints:
+            _endpoints[name] = Endpoint(name)
+        return _endpoints[name]
+
+
+def configure_endpoint(name: str, **kwargs: Any) -> Endpoint:
+    """Sostituisce l'Endpoint con il nome dato (es. con breaker e limiter condivisi tra processi)"""
+    with _endpoints_lock:
+        _endpoints[name] = Endpoint(name, **kwargs)
+        return _endpoints[name]
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    """Stato dei circuit breaker e contatori di retry di tutti gli endpoint"""
+    with _endpoints_lock:
+        return {name: endpoint.snapshot() for name, endpoint in _endpoints.items()}
@@ -9,6 +9,15 @@ import sys
 from asset_classifier_final import AssetClassifier
 
 
+def asset_pairs(asset):
+    """Ritorna le coppie (nome, valore) sia dal formato verboso {nome: valore} che da quello compatto [nome, valore]"""
+    if isinstance(asset, dict):
+        return list(asset.items())
+    if isinstance(asset, (list, tuple)) and len(asset) == 2:
+        return [(asset[0], asset[1])]
+    return []
+
+
 def extract_assets(json_result):
     """Estrae asset e valuations/percentuali dal risultato JSON"""
     try:
@@ -23,7 +32,7 @@ def extract_assets(json_result):
         valuations = []
         
         for asset in data["assets"]:
-            for asset_name, valuation in asset.items():
+            for asset_name, valuation in asset_pairs(asset):
                 assets.append(asset_name)
                 
                 # Controlla se la valuation è una percentuale
@@ -47,8 +56,8 @@ def extract_assets(json_result):
         return [], []
 
 
-def Classificationator(json_data):
-    """Funzione principale che accetta dati JSON come parametro"""
+def Classificationator(json_data, classifier=None):
+    """Funzione principale che accetta dati JSON come parametro (e opzionalmente un AssetClassifier già configurato)"""
     try:
         # Estrai gli asset usando la funzione dedicata
         assets, valuations = extract_assets(json_data)
@@ -58,7 +67,8 @@ def Classificationator(json_data):
             return []
         
         # Inizializza il classificatore
-        classifier = AssetClassifier()
+        if classifier is None:
+            classifier = AssetClassifier()
         
         # Classifica ogni asset
         results = []
@@ -0,0 +1,212 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from lookup_store import STATUS_PENDING, LookupStore
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "lookups.sqlite")
+
+
+@pytest.fixture
+def open_store(db_path):
+    """Apre LookupStore sul database del test e li chiude tutti alla fine (il GC non rilascia i file)"""
+    stores = []
+
+    def factory(**kwargs):
+        stores.append(LookupStore(db_path, **kwargs))
+        return stores[-1]
+
+    yield factory
+    for store in stores:
+        store.close()
+
+
+def counting_lookup(calls, isin="IT0000000001", cacheable=True, delay=0.0):
+    def lookup():
+        calls.append(1)
+        time.sleep(delay)
+        return isin, cacheable
+    return lookup
+
+
+def test_resolve_caches_result(open_store):
+    store = open_store()
+    calls = []
+    assert store.resolve("NAME:Apple", counting_lookup(calls)) == "IT0000000001"
+    assert store.resolve("NAME:Apple", counting_lookup(calls)) == "IT0000000001"
+    assert len(calls) == 1
+    assert (store.lookups, store.cache_hits) == (1, 1)
+
+
+def test_cache_survives_reopen(open_store):
+    open_store().resolve("NAME:Apple", counting_lookup([]))
+    calls = []
+    assert open_store().resolve("NAME:Apple", counting_lookup(calls)) == "IT0000000001"
+    assert calls == []
+
+
+def test_transient_failure_not_cached(open_store):
+    store = open_store()
+    calls = []
+    assert store.resolve("NAME:Apple", counting_lookup(calls, isin=None, cacheable=False)) is None
+    assert store.resolve("NAME:Apple", counting_lookup(calls)) == "IT0000000001"
+    assert len(calls) == 2
+
+
+def test_lookup_exception_releases_claim(open_store):
+    store = open_store()
+
+    def failing():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        store.resolve("NAME:Apple", failing)
+    calls = []
+    assert store.resolve("NAME:Apple", counting_lookup(calls)) == "IT0000000001"
+    assert len(calls) == 1
+
+
+def test_negative_result_expires(open_store):
+    store = open_store(negative_ttl=0.1)
+    calls = []
+    store.resolve("NAME:Unknown", counting_lookup(calls, isin=None))
+    store.resolve("NAME:Unknown", counting_lookup(calls, isin=None))
+    assert len(calls) == 1
+    time.sleep(0.2)
+    store.resolve("NAME:Unknown", counting_lookup(calls, isin=None))
+    assert len(calls) == 2
+
+
+def test_stale_claim_is_stolen(open_store):
+    store = open_store(pending_timeout=0.1)
+    # Prenotazione di un worker terminato senza rilasciarla
+    assert store._claim("NAME:Apple", "dead-worker")[0]
+    time.sleep(0.2)
+    calls = []
+    assert store.resolve("NAME:Apple", counting_lookup(calls)) == "IT0000000001"
+    assert len(calls) == 1
+
+
+def test_live_claim_is_not_stolen(open_store):
+    # La ricerca dura più di pending_timeout ma la prenotazione viene rinnovata
+    owner = open_store(pending_timeout=0.3, poll_interval=0.05)
+    waiter = open_store(pending_timeout=0.3, poll_interval=0.05)
+    calls, results = [], []
+    thread = threading.Thread(
+        target=lambda: results.append(owner.resolve("NAME:Apple", counting_lookup(calls, delay=1.0)))
+    )
+    thread.start()
+    time.sleep(0.5)
+    results.append(waiter.resolve("NAME:Apple", counting_lookup(calls)))
+    thread.join()
+    assert results == ["IT0000000001", "IT0000000001"]
+    assert len(calls) == 1
+    assert waiter.cache_hits == 1
+
+
+def test_release_only_by_owner(open_store):
+    store = open_store()
+    store._claim("NAME:Apple", "worker-a")
+    store._release("NAME:Apple", "worker-b")
+    row = store._conn.execute("SELECT status, owner FROM lookups WHERE query = ?", ("NAME:Apple",)).fetchone()
+    assert row == (STATUS_PENDING, "worker-a")
+
+
+def test_budget_is_enforced(open_store):
+    store = open_store(min_interval=0)
+    store.reset_budget(2)
+    assert store.acquire_request()
+    assert store.acquire_request()
+    assert not store.acquire_request()
+    assert store.budget_status() == (2, 2)
+
+
+def test_reset_budget_clears_pending_claims(open_store):
+    store = open_store()
+    store._claim("NAME:Apple", "dead-worker")
+    store.reset_budget(None)
+    assert store._claim("NAME:Apple", "worker")[0]
+
+
+def test_acquire_request_spaces_requests(open_store):
+    store = open_store(min_interval=0.1)
+    store.reset_budget(None)
+    start = time.perf_counter()
+    for _ in range(3):
+        store.acquire_request()
+    assert time.perf_counter() - start >= 0.2
+
+
+def test_throttle_and_recovery(open_store):
+    store = open_store(min_interval=1.0)
+    store.reset_budget(None)
+    assert store.on_throttle(max_interval=60) == 2.0
+    assert store.on_throttle(max_interval=3) == 3.0
+    intervals = [store.on_success() for _ in range(50)]
+    assert intervals == sorted(intervals, reverse=True)
+    assert intervals[-1] == 1.0
+
+
+# Come in batch.py: una connessione per processo worker
+_worker_store = None
+_counter_path = None
+
+
+def _init_worker(db_path, counter_path):
+    global _worker_store, _counter_path
+    _worker_store = LookupStore(db_path, min_interval=0, poll_interval=0.01)
+    _counter_path = counter_path
+
+
+def _resolve_in_worker(query):
+    def lookup():
+        if not _worker_store.acquire_request():
+            return None, False
+        with open(_counter_path, "a") as f:
+            f.write(query + "\n")
+        time.sleep(0.05)
+        return f"ISIN-{query}", True
+
+    return _worker_store.resolve(query, lookup)
+
+
+def _run_workers(db_path, counter_path, max_requests, queries):
+    # Il processo padre non deve avere connessioni aperte quando crea i worker con fork
+    store = LookupStore(db_path, min_interval=0)
+    store.reset_budget(max_requests)
+    store.close()
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(
+        max_workers=4, mp_context=context, initializer=_init_worker, initargs=(db_path, str(counter_path))
+    ) as executor:
+        return list(executor.map(_resolve_in_worker, queries))
+
+
+requires_fork = pytest.mark.skipif(
+    "fork" not in multiprocessing.get_all_start_methods(), reason="richiede il metodo di avvio fork"
+)
+
+
+@requires_fork
+def test_processes_share_cache(db_path, tmp_path):
+    counter_path = tmp_path / "lookups.log"
+    queries = ["A", "B", "C"] * 8
+    results = _run_workers(db_path, counter_path, None, queries)
+    assert results == [f"ISIN-{query}" for query in queries]
+    # Ogni query viene cercata una sola volta, da un solo processo
+    assert sorted(counter_path.read_text().split()) == ["A", "B", "C"]
+
+
+@requires_fork
+def test_processes_share_budget(db_path, tmp_path, open_store):
+    counter_path = tmp_path / "lookups.log"
+    results = _run_workers(db_path, counter_path, 5, [f"Q{i}" for i in range(20)])
+    assert sum(result is not None for result in results) == 5
+    assert len(counter_path.read_text().split()) == 5
+    assert open_store().budget_status() == (5, 5)
@@ -0,0 +1,99 @@
+import json
+
+import pytest
+
+from ocr_output import (
+    MAX_ROWS,
+    MIN_ROWS,
+    dump_rows,
+    estimate_token_budget,
+    find_loop_start,
+    parse_rows,
+)
+
+
+def test_parse_rows_compact():
+    text = '{"assets":[["Apple Inc",1200.5],["ENI","25%"],["Cash",null]]}'
+    assert parse_rows(text, compact=True) == [("Apple Inc", 1200.5), ("ENI", "25%"), ("Cash", None)]
+
+
+def test_parse_rows_verbose():
+    text = '{"assets": [{"Apple Inc": 1200.5}, {"Vanguard \\"FTSE\\"": "25%"}]}'
+    assert parse_rows(text, compact=False) == [("Apple Inc", 1200.5), ('Vanguard "FTSE"', "25%")]
+
+
+def test_parse_rows_ignores_truncated_row():
+    text = '{"assets":[["Apple Inc",1200.5],["Microsoft Co'
+    assert parse_rows(text, compact=True) == [("Apple Inc", 1200.5)]
+
+
+def test_parse_rows_format_does_not_mix():
+    assert parse_rows('{"assets":[["Apple",1]]}', compact=False) == []
+    assert parse_rows('{"assets":[{"Apple":1}]}', compact=True) == []
+
+
+@pytest.mark.parametrize("compact", [True, False])
+def test_dump_rows_round_trip(compact):
+    rows = [("Apple Inc", 1200.5), ("ENI", "25%"), ("Cash", None)]
+    dumped = dump_rows(rows, compact)
+    assert parse_rows(dumped, compact) == rows
+    assert len(json.loads(dumped)["assets"]) == 3
+
+
+def test_find_loop_start_no_loop():
+    rows = [(f"Asset {i}", i) for i in range(20)]
+    assert find_loop_start(rows) is None
+
+
+def test_find_loop_start_allows_repeated_lots():
+    # Più lotti identici dello stesso titolo non sono un loop
+    rows = [("Apple", 100)] + [("BTP 2030", 1000)] * 6
+    assert find_loop_start(rows) is None
+
+
+def test_find_loop_start_single_row_loop():
+    rows = [("Apple", 100)] + [("BTP 2030", 1000)] * 12
+    assert find_loop_start(rows) == 2
+
+
+def test_find_loop_start_block_loop():
+    block = [("ENI", 10), ("Enel", 20)]
+    rows = [("Apple", 100)] + block * 5
+    # Mantiene una sola occorrenza del blocco, contando tutte le ripetizioni
+    assert find_loop_start(rows) == 3
+
+
+def test_find_loop_start_block_below_threshold():
+    block = [("ENI", 10), ("Enel", 20), ("Intesa", 30)]
+    assert find_loop_start([("Apple", 100)] + block * 3) is None
+
+
+def test_estimate_token_budget_uses_expected_rows():
+    assert estimate_token_budget(1000, 1000, expected_rows=40) > estimate_token_budget(1000, 1000, expected_rows=20)
+
+
+def test_estimate_token_budget_compact_is_smaller():
+    assert estimate_token_budget(1000, 2000, compact=True) < estimate_token_budget(1000, 2000, compact=False)
+
+
+def test_estimate_token_budget_clamps_rows():
+    assert estimate_token_budget(1000, 10) == estimate_token_budget(1000, 10, expected_rows=MIN_ROWS)
+    assert estimate_token_budget(1000, 10**6) == estimate_token_budget(1000, 10, expected_rows=MAX_ROWS)
+
+
+def test_extract_assets_compact_format():
+    pytest.importorskip("googlesearch")
+    from test import extract_assets
+
+    assets, valuations = extract_assets({"assets": [["Apple Inc", 1200.5], ["ENI", "25%"]]})
+    assert assets == ["Apple Inc", "ENI"]
+    assert valuations == [1200.5, 0.25]
+
+
+def test_extract_assets_verbose_format():
+    pytest.importorskip("googlesearch")
+    from test import extract_assets
+
+    assets, valuations = extract_assets({"assets": [{"Apple Inc": 1200.5}, {"ENI": "25%"}]})
+    assert assets == ["Apple Inc", "ENI"]
+    assert valuations == [1200.5, 0.25]
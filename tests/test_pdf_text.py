@@ -0,0 +1,87 @@
+import pytest
+
+from pdf_text import group_words, parse_holdings_cells, parse_holdings_line, parse_number, parse_words
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("PIMCO Total Return Bond Fund IE00B11XZ103 5.000,00", {"IE00B11XZ103": 5000.0}),
+    ("Total SE 1.234,00", {"Total SE": 1234.0}),
+    ("TotalEnergies SE 1.234,00", {"TotalEnergies SE": 1234.0}),
+    ("Total Return Bond Fund IE00B11XZ103 5.000,00", {"IE00B11XZ103": 5000.0}),
+    ("Global X Data Center REITs 2.345,10", {"Global X Data Center REITs": 2345.1}),
+    ("S&P 500 ETF 1.000", {"S&P 500 ETF": 1000.0}),
+    ("FTSE 100    1.234,00", {"FTSE 100": 1234.0}),
+    ("Euro Stoxx 50 € 2.500,00", {"Euro Stoxx 50": 2500.0}),
+    ("Apple Inc US0378331005 10 150,25 1.502,50 EUR", {"US0378331005": 1502.5}),
+    ("Vanguard FTSE All-World 25%", {"Vanguard FTSE All-World": "25%"}),
+    ("ENI SpA +1,2% 3.456,00", {"ENI SpA": 3456.0}),
+    ("MSFT 12/03/2024 2,340.50", {"MSFT": 2340.5}),
+    ("IE00B4L5Y983", {"IE00B4L5Y983": None}),
+])
+def test_holdings_lines(line, expected):
+    assert parse_holdings_line(line) == expected
+
+
+@pytest.mark.parametrize("line", [
+    "Via Roma 12, 20100 Milano",
+    "Conto n. 123456",
+    "Tel. 02 1234567",
+    "Totale portafoglio 10.000,00",
+    "Totale    10.000,00",
+    "Pagina 1 di 3",
+    "Descrizione    Quantità    Controvalore",
+    "Header only text",
+    "Totale controvalore 10.000,00",
+    "Total portfolio value 10,000.00",
+    "Total Assets 12.500,00",
+    "Controvalore totale 10.000,00",
+    "Totale titoli    9.500,00",
+    "Saldo contabile 1.250,00",
+    "Liquidità disponibile 500,00",
+    "Imposta di bollo 20,00",
+    "Commissioni di gestione 35,50",
+    "Ritenute fiscali 12,30",
+])
+def test_non_holdings_lines(line):
+    assert parse_holdings_line(line) is None
+
+
+def test_name_cell_keeps_digits_and_skips_quantity_column():
+    assert parse_holdings_cells(["FTSE 100", "10", "123,40", "1.234,00"]) == {"FTSE 100": 1234.0}
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("1.234", 1234.0),
+    ("0.123", 0.123),
+    ("1,5", 1.5),
+    ("1.234.567,89", 1234567.89),
+    ("1,234.56", 1234.56),
+    ("1'234.50", 1234.5),
+])
+def test_parse_number(raw, expected):
+    assert parse_number(raw) == expected
+
+
+def _words(*rows):
+    """Costruisce parole posizionate: ogni riga è una lista di (x0, testo) con altezza 10"""
+    words = []
+    for row_index, row in enumerate(rows):
+        y0 = 100 + row_index * 20
+        for x0, text in row:
+            words.append((x0, y0, x0 + 6 * len(text), y0 + 10, text, 0, row_index, 0))
+    return words
+
+
+def test_group_words_splits_columns_by_gap():
+    words = _words([(10, "S&P"), (34, "500"), (58, "ETF"), (200, "1.000,00")])
+    assert group_words(words) == [["S&P 500 ETF", "1.000,00"]]
+
+
+def test_parse_words_ignores_header_and_address_rows():
+    words = _words(
+        [(10, "Via"), (34, "Roma"), (64, "12,"), (88, "20100"), (124, "Milano")],
+        [(10, "Descrizione"), (200, "Controvalore")],
+        [(10, "Total"), (46, "SE"), (200, "1.234,00")],
+        [(10, "Totale"), (200, "1.234,00")],
+    )
+    assert parse_words(words) == [{"Total SE": 1234.0}]
@@ -0,0 +1,230 @@
+import time
+
+import pytest
+
+from lookup_store import BudgetExhaustedError, LookupStore, SharedCircuitBreaker, SharedRateLimiter
+from resilience import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    AdaptiveLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    Endpoint,
+    RetryPolicy,
+    is_throttle,
+    is_transient,
+)
+
+
+class HttpError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"status_code": status_code, "headers": headers or {}})()
+
+
+def failing(errors, result="ok"):
+    """Funzione che solleva in ordine gli errori dati e poi ritorna result"""
+    errors = list(errors)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return result
+
+    fn.calls = calls
+    return fn
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LookupStore(str(tmp_path / "lookups.sqlite"), min_interval=0)
+    store.reset_budget(None)
+    yield store
+    store.close()
+
+
+def test_error_classification():
+    assert is_throttle(HttpError(429)) and is_transient(HttpError(429))
+    assert is_transient(HttpError(503))
+    assert is_transient(TimeoutError())
+    assert not is_transient(HttpError(400))
+    assert not is_transient(ValueError("bad"))
+
+
+def test_backoff_is_bounded_and_grows():
+    policy = RetryPolicy(base_delay=1.0, max_delay=5.0)
+    for attempt in range(6):
+        delays = [policy.delay(attempt) for _ in range(50)]
+        assert all(0 <= delay <= min(5.0, 2 ** attempt) for delay in delays)
+    assert max(policy.delay(3) for _ in range(50)) > 1.0
+
+
+def test_backoff_honours_retry_after():
+    policy = RetryPolicy(max_delay=30.0)
+    assert policy.delay(0, HttpError(429, {"retry-after": "7"})) == 7.0
+    assert policy.delay(0, HttpError(429, {"Retry-After": "120"})) == 30.0
+
+
+def test_endpoint_retries_transient_errors():
+    endpoint = Endpoint("test", policy=RetryPolicy(base_delay=0))
+    fn = failing([HttpError(503), TimeoutError()])
+    assert endpoint.call(fn) == "ok"
+    assert len(fn.calls) == 3
+    assert (endpoint.retries, endpoint.failures) == (2, 0)
+    assert endpoint.breaker.state == CLOSED
+
+
+def test_endpoint_gives_up_after_max_attempts():
+    endpoint = Endpoint("test", policy=RetryPolicy(max_attempts=3, base_delay=0))
+    fn = failing([HttpError(503)] * 5)
+    with pytest.raises(HttpError):
+        endpoint.call(fn)
+    assert len(fn.calls) == 3
+    assert endpoint.failures == 1
+
+
+def test_endpoint_does_not_retry_permanent_errors():
+    breaker = CircuitBreaker(failure_threshold=2)
+    endpoint = Endpoint("test", policy=RetryPolicy(base_delay=0), breaker=breaker)
+    breaker.record_failure()
+    fn = failing([HttpError(400)])
+    with pytest.raises(HttpError):
+        endpoint.call(fn)
+    assert len(fn.calls) == 1
+    # Un 400 non dice nulla sulla salute dell'endpoint: non azzera i fallimenti
+    assert breaker.consecutive_failures == 1
+
+
+def test_circuit_opens_and_short_circuits():
+    endpoint = Endpoint(
+        "test",
+        policy=RetryPolicy(max_attempts=1, base_delay=0),
+        breaker=CircuitBreaker(failure_threshold=2, recovery_timeout=60),
+    )
+    for _ in range(2):
+        with pytest.raises(HttpError):
+            endpoint.call(failing([HttpError(503)]))
+    assert endpoint.breaker.state == OPEN
+    fn = failing([])
+    with pytest.raises(CircuitOpenError):
+        endpoint.call(fn)
+    assert fn.calls == []
+    assert endpoint.short_circuited == 1
+
+
+def test_half_open_allows_a_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow_request()
+    time.sleep(0.1)
+    assert breaker.allow_request()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow_request()
+
+
+def test_failed_probe_reopens_circuit():
+    breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=0.05)
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.1)
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+
+
+def test_released_probe_can_be_retried():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.1)
+    assert breaker.allow_request()
+    breaker.release_probe()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
+
+
+def test_adaptive_limiter_aimd():
+    limiter = AdaptiveLimiter(initial=8, min_limit=1, max_limit=10)
+    limiter.on_throttle()
+    assert limiter.limit == 4
+    for _ in range(3):
+        limiter.on_throttle()
+    assert limiter.limit == 1
+    for _ in range(20):
+        limiter.on_success()
+    assert 1 < limiter.limit < 10
+
+
+def test_endpoint_throttle_shrinks_limiter():
+    limiter = AdaptiveLimiter(initial=8)
+    endpoint = Endpoint("test", policy=RetryPolicy(base_delay=0), limiter=limiter)
+    assert endpoint.call(failing([HttpError(429)])) == "ok"
+    assert endpoint.throttled == 1
+    assert limiter.in_flight == 0
+    assert limiter.limit < 8
+
+
+def test_shared_breaker_is_seen_by_other_processes(store, tmp_path):
+    other = LookupStore(str(tmp_path / "lookups.sqlite"))
+    try:
+        breaker = SharedCircuitBreaker(store, "google", failure_threshold=2, recovery_timeout=60)
+        other_breaker = SharedCircuitBreaker(other, "google", failure_threshold=2, recovery_timeout=60)
+        breaker.record_failure()
+        other_breaker.record_failure()
+        assert breaker.state == OPEN
+        assert other_breaker.is_open()
+        assert not other_breaker.allow_request()
+    finally:
+        other.close()
+
+
+def test_shared_breaker_single_probe(store, tmp_path):
+    other = LookupStore(str(tmp_path / "lookups.sqlite"))
+    try:
+        breaker = SharedCircuitBreaker(store, "google", failure_threshold=1, recovery_timeout=0.05)
+        other_breaker = SharedCircuitBreaker(other, "google", failure_threshold=1, recovery_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.1)
+        assert breaker.allow_request()
+        assert not other_breaker.allow_request()
+        breaker.record_success()
+        assert other_breaker.state == CLOSED
+        assert other_breaker.allow_request()
+    finally:
+        other.close()
+
+
+def test_shared_limiter_charges_every_attempt(store):
+    store.reset_budget(3)
+    endpoint = Endpoint(
+        "test",
+        policy=RetryPolicy(max_attempts=4, base_delay=0),
+        breaker=SharedCircuitBreaker(store, "test"),
+        limiter=SharedRateLimiter(store),
+    )
+    fn = failing([HttpError(503)] * 5)
+    with pytest.raises(BudgetExhaustedError):
+        endpoint.call(fn)
+    assert len(fn.calls) == 3
+    assert store.budget_status() == (3, 3)
+
+
+def test_shared_limiter_throttle_slows_everyone(tmp_path):
+    db_path = str(tmp_path / "lookups.sqlite")
+    store, other = LookupStore(db_path, min_interval=0.5), LookupStore(db_path, min_interval=0.5)
+    try:
+        store.reset_budget(None)
+        SharedRateLimiter(store, max_interval=10).on_throttle()
+        assert other.current_interval() == 1.0
+        SharedRateLimiter(other).on_success()
+        assert 0.5 <= store.current_interval() < 1.0
+    finally:
+        store.close()
+        other.close()